@@ -1,23 +1,68 @@
 import streamlit as st
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+import aiohttp
+import asyncio
 import urllib.robotparser
-import xml.etree.ElementTree as ET
-from bs4 import BeautifulSoup
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from playwright.sync_api import sync_playwright
+from urllib.parse import urlparse, urlunparse, quote, unquote
+from lxml import etree
+from recipe_parser import parse_recipe
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, RetryError
 import time
+import threading
 import logging
-from functools import wraps
+import hashlib
+import importlib.machinery
+import multiprocessing
+import os
+import tempfile
+from contextlib import suppress
+from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import deque
 
 # --- Setup ---
+# Streamlit runs this script as a fake __main__ with only __file__ set, and spawned worker processes
+# re-import __main__ from that path, re-running the whole dashboard. A "__main__" spec tells them the
+# main module needs no re-import, so parse workers only load recipe_parser
+if __name__ == "__main__":
+    __spec__ = importlib.machinery.ModuleSpec("__main__", None)
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-# Robots.txt parser and summary
-rp = urllib.robotparser.RobotFileParser()
-rp.set_url("https://www.bonappetit.com/robots.txt")
-rp.read()
+# br needs the brotli package for both requests and aiohttp to decode
+HEADERS = {"User-Agent": "SmartCrawler/1.0", "Accept-Encoding": "gzip, deflate, br"}
+CONCURRENCY = 20
+MAX_SITEMAP_EDGES = 200  # per sitemap in the visual sitemap; Graphviz chokes on more
+ROBOTS_URL = "https://www.bonappetit.com/robots.txt"
+CACHE_DIR = Path.home() / ".cache" / "smartcrawler"
+CACHE_TTL = 86400
+CHUNK_SIZE = 65536
+
+# Shared keep-alive session so repeated fetches reuse pooled connections
+SESSION = requests.Session()
+adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=0)
+SESSION.mount("https://", adapter)
+SESSION.mount("http://", adapter)
+SESSION.headers.update(HEADERS)
+
+# Spaces blocking request starts at least `delay` seconds apart across all sitemap worker threads
+class ThreadPacer:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.last = 0.0
+    def wait(self):
+        if not self.delay: return
+        with self.lock:
+            remaining = self.last + self.delay - time.monotonic()
+            if remaining > 0: time.sleep(remaining)
+            self.last = time.monotonic()
+
+SYNC_PACER = ThreadPacer()  # delay is set once robots.txt is loaded
 
 @retry(
     stop=stop_after_attempt(3),
@@ -25,22 +70,180 @@ rp.read()
     retry=retry_if_exception_type((requests.exceptions.RequestException,))
 )
 def fetch_url(url):
-    headers = {"User-Agent": "SmartCrawler/1.0"}
-    resp = requests.get(url, headers=headers, timeout=10)
+    SYNC_PACER.wait()
+    resp = SESSION.get(url, timeout=10)
     resp.raise_for_status()
     return resp
 
-# Summarize crawlability rules from robots.txt and allow download
-def get_robots_summary():
-    text = fetch_url(rp.url).text
-    allowed, disallowed, sitemaps = [], [], []
-    crawl_delay = None
-    for line in text.splitlines():
-        line = line.strip()
-        if line.lower().startswith('allow:'): allowed.append(line.split(':',1)[1].strip())
-        elif line.lower().startswith('disallow:'): disallowed.append(line.split(':',1)[1].strip())
-        elif line.lower().startswith('crawl-delay:'): crawl_delay = line.split(':',1)[1].strip()
-        elif line.lower().startswith('sitemap:'): sitemaps.append(line.split(':',1)[1].strip())
+# Robots.txt and sitemaps rarely change: keep raw bytes on disk so new processes skip the network,
+# and in st.cache_data so reruns skip the disk too
+def _cache_path(url):
+    return CACHE_DIR / hashlib.sha1(url.encode()).hexdigest()
+
+def _is_fresh(path):
+    try:
+        return time.time() - path.stat().st_mtime < CACHE_TTL
+    except OSError:
+        return False
+
+# The disk cache is best effort: an unreadable or unwritable cache dir (e.g. read-only HOME)
+# only costs the cache, never the crawl
+def _spool():
+    # Unique temp file per writer, so concurrent crawls of the same URL never interleave writes
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=CACHE_DIR, suffix=".tmp", delete=False)
+    except OSError:
+        return None
+
+def _discard(tmp):
+    if tmp is None: return
+    with suppress(OSError):
+        tmp.close()
+        os.unlink(tmp.name)
+
+def _commit(tmp, path):
+    if tmp is None: return
+    try:
+        tmp.close()
+        os.replace(tmp.name, path)
+    except OSError:
+        _discard(tmp)
+
+def _read_through(url):
+    path = _cache_path(url)
+    if _is_fresh(path):
+        with suppress(OSError):
+            return path.read_bytes()
+    resp = fetch_url(url)
+    tmp = _spool()
+    try:
+        if tmp is not None: tmp.write(resp.content)
+    except OSError:
+        _discard(tmp)
+    else:
+        _commit(tmp, path)
+    return resp.content
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_bytes(url):
+    return _read_through(url)
+
+# Disallow prefixes for "User-agent: *", precomputed once for a C-level startswith fast path
+def _disallow_prefixes(p):
+    if p.default_entry is None:
+        return ()
+    return tuple(sorted({rl.path for rl in p.default_entry.rulelines if not rl.allowance}))
+
+# Robots.txt parser and summary; built once per CACHE_TTL rather than on every Streamlit rerun
+@st.cache_resource(ttl=CACHE_TTL)
+def _robots():
+    p = urllib.robotparser.RobotFileParser(ROBOTS_URL)
+    try:
+        p.parse(fetch_bytes(ROBOTS_URL).decode("utf-8", "ignore").splitlines())
+    except RetryError as e:
+        # Same fallbacks as RobotFileParser.read(): 401/403 block everything, other 4xx allow everything.
+        # 5xx and connection errors propagate so the failure is not cached
+        resp = getattr(e.last_attempt.exception(), "response", None)
+        status = resp.status_code if resp is not None else None
+        if status in (401, 403): p.disallow_all = True
+        elif status is not None and 400 <= status < 500: p.allow_all = True
+        else: raise
+    return p, _disallow_prefixes(p)
+
+def _load_robots():
+    try:
+        return _robots(), None
+    except RetryError as e:
+        # Fail closed for this run only; the next rerun tries again
+        error = e.last_attempt.exception()
+        logger.warning(f"Could not load robots.txt ({error}); treating every URL as disallowed")
+        p = urllib.robotparser.RobotFileParser(ROBOTS_URL)
+        p.disallow_all = True
+        return (p, ()), error
+
+(rp, DISALLOW_PREFIXES), ROBOTS_ERROR = _load_robots()
+SYNC_PACER.delay = float(rp.crawl_delay("*") or 0)
+
+def _allowed(u):
+    # Same candidate string as rp.can_fetch: quoted path + params + query of the unquoted URL.
+    # A URL that hits no Disallow prefix is always allowed; anything else needs the parser's
+    # first-match rule order, so hand it to can_fetch
+    if rp.disallow_all or rp.allow_all or not rp.last_checked:
+        return rp.can_fetch("*", u)
+    parsed = urlparse(unquote(u))
+    path = quote(urlunparse(("", "", parsed.path, parsed.params, parsed.query, parsed.fragment))) or "/"
+    return not path.startswith(DISALLOW_PREFIXES) or rp.can_fetch("*", u)
+
+# Async recipe page fetches
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=10),
+    retry=retry_if_exception_type((aiohttp.ClientError, asyncio.TimeoutError))
+)
+async def _fetch(session, u, pacer=None):
+    if pacer is not None: await pacer.wait()
+    async with session.get(u, headers=HEADERS) as r:
+        r.raise_for_status()
+        _log_encoding(r)
+        return u, await r.read()
+
+# Confirm once per run that the origin honours Accept-Encoding; logged from the event loop,
+# which runs on the script thread, so the Streamlit log handler can render it
+_encoding_logged = False
+
+def _log_encoding(resp):
+    global _encoding_logged
+    if not _encoding_logged:
+        _encoding_logged = True
+        logger.info(f"Content-Encoding negotiated: {resp.headers.get('Content-Encoding') or 'identity'}")
+
+# Spaces request starts (retries included) at least `delay` seconds apart across all workers
+class Pacer:
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = asyncio.Lock()
+        self.last = 0.0
+    async def wait(self):
+        async with self.lock:
+            remaining = self.last + self.delay - time.monotonic()
+            if remaining > 0: await asyncio.sleep(remaining)
+            self.last = time.monotonic()
+
+async def _bounded(sem, coro):
+    async with sem:
+        return await coro
+
+async def _parse_in(pex, job):
+    # Hand each body to the process pool as soon as it lands so parsing overlaps the remaining fetches
+    pair = await job
+    return await asyncio.get_running_loop().run_in_executor(pex, parse_recipe, pair)
+
+# Fetch every recipe page and parse it in the process pool
+async def fetch_all(urls, pex):
+    # Crawl-delay caps the combined request rate, so the fan-out only helps when none is declared
+    delay = rp.crawl_delay("*")
+    pacer = Pacer(float(delay)) if delay else None
+    sem = asyncio.Semaphore(CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=10)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as s:
+        jobs = (_parse_in(pex, _bounded(sem, _fetch(s, u, pacer))) for u in urls)
+        return await asyncio.gather(*jobs, return_exceptions=True)
+
+# Summarize crawlability rules from robots.txt and allow download;
+# keyed by the parser's load time so a reloaded robots.txt never serves a stale summary
+@st.cache_data(ttl=3600)
+@lru_cache(maxsize=1)
+def get_robots_summary(loaded_at):
+    # Built from the already-parsed rp instead of downloading robots.txt again
+    allowed, disallowed = [], []
+    for entry in rp.entries + ([rp.default_entry] if rp.default_entry else []):
+        for rl in entry.rulelines:
+            # RuleLine stores paths quoted, and turns an empty "Disallow:" into an allow of ""
+            (allowed if rl.allowance and rl.path else disallowed).append(unquote(rl.path))
+    crawl_delay = rp.crawl_delay("*")
+    sitemaps = rp.site_maps() or []
     summary = (
         f"Allowed paths: {allowed}\n"
         f"Disallowed paths: {disallowed}\n"
@@ -54,11 +257,17 @@ class StreamlitLogHandler(logging.Handler):
     def __init__(self, placeholder):
         super().__init__()
         self.placeholder = placeholder
-        self.log_content = ""
+        self.lines = deque(maxlen=200)
+        self._last = 0.0
     def emit(self, record):
-        msg = self.format(record)
-        self.log_content += msg + "\n"
-        self.placeholder.code(self.log_content, language="text")
+        self.lines.append(self.format(record))
+        # Re-render the tail at most every 250 ms; warnings and errors always show immediately
+        if record.levelno >= logging.WARNING or time.monotonic() - self._last > 0.25:
+            self.render()
+    def render(self):
+        # Called at phase boundaries so records throttled away before a long quiet stretch still show
+        self._last = time.monotonic()
+        self.placeholder.code("\n".join(self.lines), language="text")
 
 # Placeholder for logs
 log_placeholder = st.empty()
@@ -66,74 +275,150 @@ streamlit_handler = StreamlitLogHandler(log_placeholder)
 streamlit_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
 logger.addHandler(streamlit_handler)
 
-# Caching decorator for sitemaps and API checks
-def cache(func):
-    cache_data = {}
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        key = (func.__name__, args, tuple(sorted(kwargs.items())))
-        if key not in cache_data:
-            cache_data[key] = func(*args, **kwargs)
-        return cache_data[key]
-    return wrapper
-
-@cache
+SITEMAP_LOC = "{http://www.sitemaps.org/schemas/sitemap/0.9}loc"
+
+# Pull <loc> values out of sitemap chunks as they arrive, freeing nodes as we go
+def _parse_locs(chunks):
+    parser = etree.XMLPullParser(events=("end",), tag=SITEMAP_LOC)
+    urls = []
+    for chunk in chunks:
+        parser.feed(chunk)
+        for _, elem in parser.read_events():
+            if elem.text: urls.append(elem.text)
+            elem.clear()
+            url = elem.getparent()
+            while url is not None and url.getprevious() is not None:
+                del url.getparent()[0]
+    parser.close()
+    return urls
+
+def _tee(chunks, f):
+    for chunk in chunks:
+        if f is not None: f.write(chunk)
+        yield chunk
+
+# Parse the sitemap while it downloads and spool it into the disk cache at the same time;
+# a fresh cache file is streamed from disk instead
+def _sitemap_locs(url):
+    path = _cache_path(url)
+    if _is_fresh(path):
+        try:
+            with path.open("rb") as f:
+                return _parse_locs(iter(lambda: f.read(CHUNK_SIZE), b""))
+        except (etree.XMLSyntaxError, OSError):
+            # Corrupt or unreadable cache entry: drop it and refetch
+            with suppress(OSError):
+                path.unlink()
+    tmp = _spool()
+    try:
+        SYNC_PACER.wait()
+        with SESSION.get(url, stream=True, timeout=10) as resp:
+            resp.raise_for_status()
+            urls = _parse_locs(_tee(resp.iter_content(CHUNK_SIZE), tmp))
+    except requests.HTTPError as e:
+        _discard(tmp)
+        # A 4xx (e.g. a week with no sitemap) won't change on retry
+        if 400 <= e.response.status_code < 500: return []
+        return _parse_locs([_read_through(url)])
+    except Exception:
+        _discard(tmp)
+        # Fall back to the buffered, retried fetch
+        return _parse_locs([_read_through(url)])
+    _commit(tmp, path)
+    return urls
+
+def _safe_locs(url):
+    try:
+        return _sitemap_locs(url)
+    except Exception:
+        return []
+
+# Flat (year, month, week) list for the inclusive sidebar range; empty when start is after end
+def _date_tuples(sy, sm, sw, ey, em, ew):
+    out = []
+    for y in range(sy, ey+1):
+        ms, me = (sm if y==sy else 1), (em if y==ey else 12)
+        for m in range(ms, me+1):
+            ws = sw if (y==sy and m==sm) else 1
+            we = ew if (y==ey and m==em) else 4
+            for w in range(ws, we+1): out.append((y, m, w))
+    return out
+
+# Sitemaps and API checks are cached in-process (lru_cache) and across reruns (st.cache_data);
+# results are returned as tuples so cached values stay immutable
+@st.cache_data(ttl=3600)
+@lru_cache(maxsize=64)
 def get_content_urls(start_year, start_month, start_week, end_year, end_month, end_week):
     sitemap_map, total_checked, total_crawlable = {}, 0, 0
-    for year in range(start_year, end_year+1):
-        m_start = start_month if year==start_year else 1
-        m_end   = end_month   if year==end_year   else 12
-        for month in range(m_start, m_end+1):
-            for week in range(1,5):
-                if year==end_year and month==end_month and week> end_week: break
-                url = f"https://www.bonappetit.com/sitemap.xml?year={year}&month={month}&week={week}"
-                try:
-                    resp = fetch_url(url)
-                    root = ET.fromstring(resp.content)
-                    urls = [loc.text for loc in root.findall(".//{http://www.sitemaps.org/schemas/sitemap/0.9}loc")]
-                except:
-                    urls = []
-                crawlable = [u for u in urls if rp.can_fetch("*", u)]
-                sitemap_map[url] = crawlable
-                total_checked += len(urls)
-                total_crawlable += len(crawlable)
-    return sitemap_map, total_checked, total_crawlable
+    sitemap_urls = [
+        f"https://www.bonappetit.com/sitemap.xml?year={y}&month={m}&week={w}"
+        for y, m, w in _date_tuples(start_year, start_month, start_week, end_year, end_month, end_week)
+    ]
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        results = list(ex.map(_safe_locs, sitemap_urls))
+    for url, urls in zip(sitemap_urls, results):
+        crawlable = [u for u in urls if _allowed(u)]
+        sitemap_map[url] = tuple(crawlable)
+        total_checked += len(urls)
+        total_crawlable += len(crawlable)
+    return tuple(sitemap_map.items()), total_checked, total_crawlable
+
+# One parse pool per process; "spawn" avoids forking the multi-threaded Streamlit server
+@st.cache_resource
+def _parse_pool():
+    return ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
 
 # JS-heavy detection and data extraction
-def extract_all_recipes(urls):
-    recipes, js_heavy = [], []
-    for u in urls:
-        try:
-            resp = fetch_url(u)
-            soup = BeautifulSoup(resp.content, "lxml")
-            if "/recipe/" in u:
-                title = soup.select_one("h1[data-testid='ContentHeaderHed']").get_text(strip=True) if soup.select_one("h1[data-testid='ContentHeaderHed']") else "No title"
-                desc  = soup.select_one("div.container--body-inner p").get_text(strip=True) if soup.select_one("div.container--body-inner p") else "No description"
-                recipes.append({"title":title, "description":desc, "link":u})
-                logger.info({"title":title, "description":desc, "link":u})
-        except:
+async def extract_all_recipes_async(urls):
+    titles, descs, links, js_heavy = [], [], [], []
+    results = await fetch_all(urls, _parse_pool())
+    for u, res in zip(urls, results):
+        if isinstance(res, BaseException):
             js_heavy.append(u)
-    return recipes, js_heavy
+            continue
+        title, desc = res
+        titles.append(title)
+        descs.append(desc)
+        links.append(u)
+        logger.info({"title":title, "description":desc, "link":u})
+    return titles, descs, links, js_heavy
+
+# Check for open APIs / RSS feeds; HEAD is enough to see whether an endpoint exists
+async def _probe(session, url, pacer=None):
+    try:
+        if pacer is not None: await pacer.wait()
+        async with session.head(url, allow_redirects=True, headers=HEADERS) as r:
+            status = r.status
+        # Servers without HEAD support answer 405 or 501
+        if status in (405, 501):
+            if pacer is not None: await pacer.wait()
+            async with session.get(url, headers=HEADERS) as r:
+                status = r.status
+        return url if status < 400 else None
+    except Exception:
+        return None
+
+async def check_open_apis_async(feeds):
+    delay = rp.crawl_delay("*")
+    pacer = Pacer(float(delay)) if delay else None
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as s:
+        return [u for u in await asyncio.gather(*(_probe(s, f, pacer) for f in feeds)) if u]
 
-# Check for open APIs / RSS feeds
+@st.cache_data(ttl=3600)
+@lru_cache(maxsize=1)
 def check_open_apis():
     feeds = ["https://www.bonappetit.com/feed/rss", "https://www.bonappetit.com/api/"]
-    available = []
-    for f in feeds:
-        try:
-            fetch_url(f)
-            available.append(f)
-        except:
-            pass
-    return available
+    return tuple(asyncio.run(check_open_apis_async(feeds)))
 
 # --- Streamlit UI ---
 st.title("🕷️ Web Crawler Dashboard For bonappetit website")
 
 # Top-of-page summary and download
 st.header("Summary of Crawlability Rules")
-summary = get_robots_summary()
+summary = get_robots_summary(rp.mtime())
 st.text(summary)
+if ROBOTS_ERROR:
+    st.warning(f"robots.txt could not be loaded ({ROBOTS_ERROR}). Every URL is treated as disallowed until it can be fetched.")
 st.download_button(
     label="Download robots.txt summary",
     data=summary,
@@ -152,19 +437,27 @@ end_week    = st.sidebar.number_input("End Week", min_value=1, max_value=4, valu
 
 if st.sidebar.button("Run Crawl"):
     logger.info("Crawl started.")
+    streamlit_handler.render()
     try:
         # Fetch URLs
-        sitemap_map, total_checked, total_crawlable = get_content_urls(
+        sitemap_items, total_checked, total_crawlable = get_content_urls(
             start_year, start_month, start_week,
             end_year, end_month, end_week
         )
+        sitemap_map = dict(sitemap_items)
         # Crawlability score
         crawl_score = (total_crawlable/total_checked*100) if total_checked else 0
         st.metric("Crawlability Score", f"{crawl_score:.1f}%")
 
         # Extract data + JS detection
-        all_urls = [u for urls in sitemap_map.values() for u in urls]
-        recipes, js_heavy = extract_all_recipes(all_urls)
+        # Only unique /recipe/ pages are worth fetching
+        sitemap_urls = [u for urls in sitemap_map.values() for u in urls if "/recipe/" in u]
+        all_urls = list(dict.fromkeys(sitemap_urls))
+        logger.info(f"Fetching {len(all_urls)} recipe pages ({len(sitemap_urls) - len(all_urls)} duplicates skipped)")
+        streamlit_handler.render()
+        titles, descs, links, js_heavy = asyncio.run(extract_all_recipes_async(all_urls))
+        # Per-recipe records arrive in one burst once the fetch returns; show the whole tail once
+        streamlit_handler.render()
 
         # Display JS-heavy determination
         st.subheader("JavaScript-Heavy Check")
@@ -175,8 +468,10 @@ if st.sidebar.button("Run Crawl"):
 
         # Extracted data
         st.subheader("Top Extracted Recipes")
-        if recipes:
-            st.dataframe(pd.DataFrame(recipes))
+        if titles:
+            # Arrow-backed strings are stored contiguously and go to the browser without re-encoding
+            df = pd.DataFrame({"title": titles, "description": descs, "link": links}, copy=False).convert_dtypes(dtype_backend="pyarrow")
+            st.dataframe(df, width="stretch", hide_index=True)
         else:
             st.write("No recipes extracted.")
 
@@ -198,12 +493,12 @@ if st.sidebar.button("Run Crawl"):
 
         # Visual sitemap
         st.subheader("Visual Sitemap")
-        dot = "digraph sitemap {\n"
+        parts = ["digraph sitemap {"]
         for sm, urls in sitemap_map.items():
-            dot += f'  "{sm}" [shape=box, color=lightblue];\n'
-            for u in urls:
-                dot += f'  "{sm}" -> "{u}";\n'
-        dot += "}"
+            parts.append(f'  "{sm}" [shape=box, color=lightblue];')
+            parts.extend(f'  "{sm}" -> "{u}";' for u in urls[:MAX_SITEMAP_EDGES])
+        parts.append("}")
+        dot = "\n".join(parts)
         st.graphviz_chart(dot)
 
         logger.info("Dashboard rendered successfully.")
@@ -0,0 +1,23 @@
+from bs4 import BeautifulSoup, SoupStrainer
+import soupsieve as sv
+
+# Kept out of app.py so ProcessPoolExecutor workers can import it without re-running the Streamlit script
+
+# Recipe pages only need the title <h1> and the body container; skip building the rest of the tree
+class RecipeStrainer(SoupStrainer):
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        if name == "h1": return True
+        return name == "div" and "container--body-inner" in (attrs or {}).get("class", "").split()
+
+STRAINER = RecipeStrainer()
+TITLE_SEL = sv.compile("h1[data-testid='ContentHeaderHed']")
+DESC_SEL  = sv.compile("div.container--body-inner p")
+
+def parse_recipe(args):
+    _, body = args
+    soup = BeautifulSoup(body, "lxml", parse_only=STRAINER)
+    h = TITLE_SEL.select_one(soup)
+    d = DESC_SEL.select_one(soup)
+    title = h.get_text(strip=True) if h else "No title"
+    desc  = d.get_text(strip=True) if d else "No description"
+    return title, desc